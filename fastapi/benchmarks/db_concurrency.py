@@ -0,0 +1,120 @@
+"""
+Concurrent request latency: blocking psycopg2 on the event loop vs the async data-access layer.
+
+Simulates ``--requests`` handler invocations issued ``--concurrency`` at a time, each running
+one query that takes ``--query-ms`` on the server (``pg_sleep``), and reports p50/p99 latency
+and throughput for:
+
+  blocking    psycopg2 called directly inside ``async def`` (the previous handler behaviour)
+  threadpool  db.ThreadedDatabase (psycopg2 in bounded worker threads)
+  async       db.AsyncDatabase (native psycopg 3)
+
+Usage:
+    DATABASE_URL=postgresql://... python benchmarks/db_concurrency.py --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from db import ConnectionPool, create_database  # noqa: E402
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def drive(handler, total, concurrency):
+    """
+    Closed-loop load: ``concurrency`` clients each send their next request as soon as the
+    previous one completes. Latency is measured from the moment a request is sent, so time
+    spent waiting for a blocked event loop is counted, as a real client would see it.
+    """
+    latencies = []
+    remaining = [total]
+
+    async def client(sent):
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            # Receiving a request always yields to the loop, as reading from a socket would
+            await asyncio.sleep(0)
+            await handler()
+            done = time.perf_counter()
+            latencies.append(done - sent)
+            sent = done
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(start) for _ in range(concurrency)))
+    return latencies, time.perf_counter() - start
+
+
+async def run_blocking(args):
+    pool = ConnectionPool(args.dsn, min_size=args.pool_size, max_size=args.pool_size)
+    pool.open()
+
+    async def handler():
+        with pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT pg_sleep(%s)", (args.query_ms / 1000,))
+            cursor.close()
+
+    try:
+        return await drive(handler, args.requests, args.concurrency)
+    finally:
+        pool.close()
+
+
+async def run_layer(args, backend):
+    database = create_database(backend, args.dsn, min_size=args.pool_size, max_size=args.pool_size)
+    await database.open()
+
+    async def handler():
+        async with database.session() as db:
+            await db.fetchone("SELECT pg_sleep(%s)", (args.query_ms / 1000,))
+
+    try:
+        return await drive(handler, args.requests, args.concurrency)
+    finally:
+        await database.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--query-ms", type=float, default=10.0)
+    parser.add_argument("--modes", default="blocking,threadpool,async")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn or DATABASE_URL is required")
+
+    # Warm the server so the first mode does not pay for cold caches
+    conn = psycopg2.connect(args.dsn)
+    conn.close()
+
+    print(f"{'mode':<12}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}")
+    for mode in args.modes.split(","):
+        if mode == "blocking":
+            latencies, elapsed = await run_blocking(args)
+        else:
+            latencies, elapsed = await run_layer(args, mode)
+        print(
+            f"{mode:<12}"
+            f"{statistics.median(latencies) * 1000:>10.1f}"
+            f"{percentile(latencies, 99) * 1000:>10.1f}"
+            f"{len(latencies) / elapsed:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
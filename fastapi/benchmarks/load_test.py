@@ -0,0 +1,429 @@
+"""
+End-to-end load test: main:app under uvicorn against a disposable PostgreSQL.
+
+1. Creates a throwaway database, either as a fresh cluster (initdb; needs the PostgreSQL
+   server binaries on PATH or in --pg-bin) or as a temporary database on the server in
+   --dsn. It is removed afterwards.
+2. Starts the app with uvicorn in a subprocess; migrations run at startup.
+3. Seeds --users users, each with --tasks/--notes/--posts rows, with bulk SQL. All users
+   share one password, so seeding costs a single bcrypt hash.
+4. Logs every user in, then runs --concurrency closed-loop clients for --duration seconds
+   (after --warmup seconds that are not recorded). Each iteration picks a scenario by
+   --mix weight:
+      dashboard  summary plus the first page of tasks, notes and posts, fetched concurrently
+      list       one filtered list page (status, priority, category or substring search)
+      search     /search across all collections
+      churn      create, patch (If-Match), read and delete a task
+      login      POST /auth/login, bound by bcrypt
+5. Writes request rate and p50/p95/p99 latency per endpoint (route template) and per
+   scenario to --output as JSON with sorted keys, so reports from two commits can be
+   diffed; --baseline prints the change against an earlier report.
+
+Requires httpx and uvicorn.
+
+Usage:
+    python benchmarks/load_test.py --dsn postgresql://postgres@localhost/postgres --users 50 --duration 30
+    python benchmarks/load_test.py --pg-bin /usr/lib/postgresql/16/bin --output after.json --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List
+
+import httpx
+import psycopg2
+from passlib.context import CryptContext
+from psycopg2.extensions import make_dsn
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PASSWORD = "load-test-password"
+VOCABULARY = 1000
+
+DEFAULT_MIX = "dashboard=3,list=4,search=1,churn=2,login=0.2"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Disposable database
+@contextmanager
+def temporary_database(admin_dsn: str) -> Iterator[str]:
+    """A database created on an existing server for this run and dropped afterwards."""
+    name = f"loadtest_{uuid.uuid4().hex[:8]}"
+    admin = psycopg2.connect(admin_dsn)
+    admin.autocommit = True
+    try:
+        admin.cursor().execute(f"CREATE DATABASE {name}")
+        try:
+            yield make_dsn(admin_dsn, dbname=name)
+        finally:
+            admin.cursor().execute(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)")
+    finally:
+        admin.close()
+
+
+@contextmanager
+def temporary_cluster(pg_bin: str) -> Iterator[str]:
+    """A fresh cluster in a temporary directory, reachable only over its Unix socket."""
+    def tool(name):
+        return os.path.join(pg_bin, name) if pg_bin else shutil.which(name) or name
+
+    data_dir = tempfile.mkdtemp(prefix="loadtest-pg-")
+    port = free_port()
+    try:
+        subprocess.run(
+            [tool("initdb"), "-D", data_dir, "-U", "postgres", "--auth=trust", "--no-sync"],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        subprocess.run(
+            [tool("pg_ctl"), "-D", data_dir, "-l", os.path.join(data_dir, "server.log"), "-w", "start",
+             "-o", f"-p {port} -k {data_dir} -c listen_addresses='' -c fsync=off -c max_connections=200"],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        try:
+            yield f"host={data_dir} port={port} user=postgres dbname=postgres"
+        finally:
+            subprocess.run([tool("pg_ctl"), "-D", data_dir, "-m", "fast", "-w", "stop"], stdout=subprocess.DEVNULL)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+# Application
+@contextmanager
+def running_app(dsn: str, args) -> Iterator[str]:
+    port = free_port()
+    env = {
+        **os.environ,
+        "DATABASE_URL": dsn,
+        "DB_BACKEND": args.backend,
+        "RUN_MIGRATIONS_ON_STARTUP": "true",
+        "DEBUG": "false",
+        # Every simulated user logs in from 127.0.0.1
+        "RATE_LIMIT_BACKEND": "none",
+        **dict(item.split("=", 1) for item in args.app_env),
+    }
+    log = open(args.app_log, "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+        cwd=APP_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"App exited during startup with code {process.returncode}; see {args.app_log}")
+            try:
+                if httpx.get(f"{base_url}/health", timeout=1).json().get("status") == "healthy":
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("App did not become healthy within 60s")
+            time.sleep(0.2)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        log.close()
+
+
+def seed(dsn: str, args) -> List[str]:
+    """Bulk-insert users and their content; returns the users' emails."""
+    password_hash = CryptContext(schemes=["bcrypt"]).hash(PASSWORD)
+    conn = psycopg2.connect(dsn)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO users (email, password_hash, full_name)"
+            " SELECT 'load-' || g || '@example.com', %s, 'Load User ' || g FROM generate_series(1, %s) AS g"
+            " RETURNING id, email",
+            (password_hash, args.users)
+        )
+        users = cursor.fetchall()
+        user_ids = [row[0] for row in users]
+        words = f"(SELECT string_agg('word' || floor(random() * {VOCABULARY})::int, ' ') FROM generate_series(1, 12 + 0 * g))"
+        cursor.execute(
+            "INSERT INTO tasks (user_id, title, description, status, priority)"
+            f" SELECT u, 'task ' || g, {words},"
+            " (ARRAY['pending', 'in_progress', 'completed'])[1 + mod(g, 3)], (ARRAY['low', 'medium', 'high'])[1 + mod(g, 3)]"
+            " FROM unnest(%s::int[]) AS u, generate_series(1, %s) AS g",
+            (user_ids, args.tasks)
+        )
+        cursor.execute(
+            "INSERT INTO notes (user_id, title, content, category, is_favorite)"
+            f" SELECT u, 'note ' || g, {words}, (ARRAY['work', 'personal', 'ideas'])[1 + mod(g, 3)], mod(g, 5) = 0"
+            " FROM unnest(%s::int[]) AS u, generate_series(1, %s) AS g",
+            (user_ids, args.notes)
+        )
+        cursor.execute(
+            "INSERT INTO posts (user_id, title, content, status, tags)"
+            f" SELECT u, 'post ' || g, {words}, (ARRAY['draft', 'published', 'archived'])[1 + mod(g, 3)], ARRAY['tag' || mod(g, 10)]"
+            " FROM unnest(%s::int[]) AS u, generate_series(1, %s) AS g",
+            (user_ids, args.posts)
+        )
+        conn.commit()
+        conn.autocommit = True
+        cursor.execute("ANALYZE")
+        return [row[1] for row in users]
+    finally:
+        conn.close()
+
+
+# Load generation
+class Recorder:
+    def __init__(self):
+        self.recording = False
+        self.endpoints: Dict[str, List[float]] = {}
+        self.scenarios: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    async def request(self, client: httpx.AsyncClient, label: str, method: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.error(label)
+            raise
+        if self.recording:
+            self.endpoints.setdefault(label, []).append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                self.error(label)
+        return response
+
+    def error(self, label: str):
+        if self.recording:
+            self.errors[label] = self.errors.get(label, 0) + 1
+
+
+async def dashboard(client, recorder, user, rng):
+    await asyncio.gather(
+        recorder.request(client, "GET /dashboard/summary", "GET", "/dashboard/summary", headers=user["headers"]),
+        recorder.request(client, "GET /tasks", "GET", "/tasks", params={"limit": 5}, headers=user["headers"]),
+        recorder.request(client, "GET /notes", "GET", "/notes", params={"limit": 5}, headers=user["headers"]),
+        recorder.request(client, "GET /posts", "GET", "/posts", params={"limit": 5}, headers=user["headers"]),
+    )
+
+
+async def filtered_list(client, recorder, user, rng):
+    collection = rng.choice(["tasks", "notes", "posts"])
+    params = {"limit": 20}
+    if collection == "tasks":
+        params["status_filter"] = rng.choice(["pending", "in_progress", "completed"])
+        if rng.random() < 0.5:
+            params["priority_filter"] = rng.choice(["low", "medium", "high"])
+    elif collection == "notes":
+        params["category_filter"] = rng.choice(["work", "personal", "ideas"])
+    else:
+        params["status_filter"] = rng.choice(["draft", "published", "archived"])
+    if rng.random() < 0.3:
+        params["search"] = f"word{rng.randrange(VOCABULARY)}"
+    await recorder.request(client, f"GET /{collection}", "GET", f"/{collection}", params=params, headers=user["headers"])
+
+
+async def search(client, recorder, user, rng):
+    await recorder.request(
+        client, "GET /search", "GET", "/search", params={"q": f"word{rng.randrange(VOCABULARY)}"}, headers=user["headers"]
+    )
+
+
+async def churn(client, recorder, user, rng):
+    headers = user["headers"]
+    created = await recorder.request(
+        client, "POST /tasks", "POST", "/tasks", json={"title": "churn", "description": "load test"}, headers=headers
+    )
+    if created.status_code != 201:
+        return
+    task_id = created.json()["id"]
+    patched = await recorder.request(
+        client, "PATCH /tasks/{task_id}", "PATCH", f"/tasks/{task_id}", json={"status": "completed"},
+        headers={**headers, "If-Match": created.headers.get("ETag", "*")}
+    )
+    await recorder.request(
+        client, "GET /tasks/{task_id}", "GET", f"/tasks/{task_id}", headers={**headers, "If-None-Match": patched.headers.get("ETag", "")}
+    )
+    await recorder.request(client, "DELETE /tasks/{task_id}", "DELETE", f"/tasks/{task_id}", headers=headers)
+
+
+async def login(client, recorder, user, rng):
+    await recorder.request(client, "POST /auth/login", "POST", "/auth/login", json={"email": user["email"], "password": PASSWORD})
+
+
+SCENARIOS = {"dashboard": dashboard, "list": filtered_list, "search": search, "churn": churn, "login": login}
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, weight = item.split("=")
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}; expected one of {', '.join(SCENARIOS)}")
+        weights[name] = float(weight)
+    return weights
+
+
+async def drive(base_url: str, emails: List[str], args) -> dict:
+    mix = parse_mix(args.mix)
+    names, weights = list(mix), list(mix.values())
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency * 4, max_keepalive_connections=args.concurrency * 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+        # A few logins at a time, so the bcrypt queue never sheds them
+        slots = asyncio.Semaphore(8)
+
+        async def log_in(email: str) -> dict:
+            async with slots:
+                response = await client.post("/auth/login", json={"email": email, "password": PASSWORD})
+            response.raise_for_status()
+            return {"email": email, "headers": {"Authorization": f"Bearer {response.json()['access_token']}"}}
+
+        users = await asyncio.gather(*(log_in(email) for email in emails))
+
+        async def worker(seed: int, deadline: float):
+            rng = random.Random(seed)
+            while time.perf_counter() < deadline:
+                scenario = rng.choices(names, weights)[0]
+                start = time.perf_counter()
+                try:
+                    await SCENARIOS[scenario](client, recorder, rng.choice(users), rng)
+                except httpx.HTTPError:
+                    continue
+                if recorder.recording:
+                    recorder.scenarios.setdefault(scenario, []).append(time.perf_counter() - start)
+
+        warmup_end = time.perf_counter() + args.warmup
+        deadline = warmup_end + args.duration
+        workers = [asyncio.create_task(worker(args.seed + n, deadline)) for n in range(args.concurrency)]
+        await asyncio.sleep(max(0.0, warmup_end - time.perf_counter()))
+        recorder.recording = True
+        started = time.perf_counter()
+        await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - started
+
+    def summarize(latencies: List[float], errors: int = 0) -> dict:
+        return {
+            "count": len(latencies),
+            "errors": errors,
+            "rps": round(len(latencies) / elapsed, 2),
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        }
+
+    all_requests = [value for values in recorder.endpoints.values() for value in values]
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "total": summarize(all_requests, sum(recorder.errors.values())) if all_requests else {},
+        "endpoints": {
+            label: summarize(values, recorder.errors.get(label, 0)) for label, values in sorted(recorder.endpoints.items())
+        },
+        "scenarios": {name: summarize(values) for name, values in sorted(recorder.scenarios.items())},
+    }
+
+
+# Reporting
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def print_report(report: dict, baseline: dict = None):
+    def change(section, label, key):
+        if not baseline or label not in baseline.get(section, {}):
+            return ""
+        before = baseline[section][label][key]
+        after = report[section][label][key]
+        return f" ({(after - before) / before * 100:+.0f}%)" if before else ""
+
+    print(f"{report['config']['concurrency']} clients, {report['elapsed_s']}s, commit {report['commit'] or 'unknown'}")
+    for section in ("endpoints", "scenarios"):
+        print(f"  {section[:-1]:<28}{'req/s':>14}{'p50 ms':>16}{'p95 ms':>16}{'p99 ms':>16}{'errors':>8}")
+        for label, row in report[section].items():
+            print(
+                f"  {label:<28}"
+                f"{row['rps']:>8.1f}{change(section, label, 'rps'):>6}"
+                f"{row['p50_ms']:>9.1f}{change(section, label, 'p50_ms'):>7}"
+                f"{row['p95_ms']:>9.1f}{change(section, label, 'p95_ms'):>7}"
+                f"{row['p99_ms']:>9.1f}{change(section, label, 'p99_ms'):>7}"
+                f"{row['errors']:>8}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"), help="existing server to create a temporary database on")
+    parser.add_argument("--pg-bin", default=None, help="directory with initdb/pg_ctl, used when --dsn is not set")
+    parser.add_argument("--backend", choices=["async", "threadpool"], default="async")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE", help="extra app environment")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=200, help="tasks per user")
+    parser.add_argument("--notes", type=int, default=100, help="notes per user")
+    parser.add_argument("--posts", type=int, default=50, help="posts per user")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds of load before measuring")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario weights")
+    parser.add_argument("--seed", type=int, default=1, help="random seed, for repeatable request sequences")
+    parser.add_argument("--output", default="load_test_report.json")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--app-log", default="load_test_app.log", help="where the app's own output goes")
+    args = parser.parse_args()
+    parse_mix(args.mix)
+
+    database = temporary_database(args.dsn) if args.dsn else temporary_cluster(args.pg_bin)
+    with database as dsn:
+        with running_app(dsn, args) as base_url:
+            # Seeded after startup so the schema comes from the app's own migrations
+            emails = seed(dsn, args)
+            results = asyncio.run(drive(base_url, emails, args))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            key: getattr(args, key)
+            for key in ("backend", "workers", "app_env", "users", "tasks", "notes", "posts", "concurrency", "duration", "warmup", "mix", "seed")
+        },
+        **results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Parse/plan time saved by the prepared-statement registry.
+
+Seeds one throwaway user with ``--rows`` tasks, then runs the hot-path statements from
+main.py on a single pooled connection, ``--repeat`` times each, once with the registry
+disabled (parsed and planned on every call) and once enabled (prepared on first use,
+then executed by name). The difference in median latency is what every request saves
+per statement. Writes run inside a transaction that is rolled back. The user (and its
+tasks) is deleted afterwards.
+
+Usage:
+    DATABASE_URL=postgresql://... python benchmarks/prepared_statements.py --backend threadpool
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from db import create_database, statements  # noqa: E402
+from main import COLLECTION_VERSION, DELETE_BY_ID, INSERT_TASK, ROW_BY_ID, TASK_COLUMNS, USER_BY_EMAIL  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+
+def hot_path(user_id: int, email: str, task_id: int):
+    """(label, statement, params) for the queries a typical authenticated request runs."""
+    list_query = statements.get(
+        f"SELECT {TASK_COLUMNS} FROM tasks WHERE user_id = %s AND status = %s"
+        " ORDER BY created_at DESC, id DESC LIMIT %s"
+    )
+    return [
+        ("user by email", USER_BY_EMAIL, (email,)),
+        ("collection version", COLLECTION_VERSION, (user_id, "tasks.version")),
+        ("task by id", ROW_BY_ID["tasks"], (task_id, user_id)),
+        ("task list (status, limit)", list_query, (user_id, "pending", 21)),
+        ("insert task", INSERT_TASK, (user_id, "bench", None, "medium")),
+        ("delete missing task", DELETE_BY_ID["tasks"], (0, user_id)),
+    ]
+
+
+async def measure(db, statement, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await db.execute(statement, params)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+async def run(args):
+    database = create_database(args.backend, args.dsn, min_size=1, max_size=1)
+    await database.open()
+    try:
+        async with database.session() as db:
+            await migrate(db)
+            email = f"bench-prepared-{uuid.uuid4().hex[:8]}@example.com"
+            user = await db.fetchone(
+                "INSERT INTO users (email, password_hash, full_name) VALUES (%s, 'x', 'Prepared Benchmark') RETURNING id",
+                (email,)
+            )
+            await db.execute(
+                "INSERT INTO tasks (user_id, title) SELECT %s, 'task ' || g FROM generate_series(1, %s) AS g",
+                (user["id"], args.rows)
+            )
+            task = await db.fetchone("SELECT max(id) AS id FROM tasks WHERE user_id = %s", (user["id"],))
+            await db.commit()
+            try:
+                queries = hot_path(user["id"], email, task["id"])
+                results = {}
+                for enabled in (False, True):
+                    statements.enabled = enabled
+                    for label, statement, params in queries:
+                        # Warm up: the enabled run pays its one PREPARE here, not in the timings
+                        await measure(db, statement, params, 3)
+                        results[label, enabled] = await measure(db, statement, params, args.repeat)
+                    await db.rollback()
+            finally:
+                await db.rollback()
+                await db.execute("DELETE FROM users WHERE id = %s", (user["id"],))
+                await db.commit()
+    finally:
+        await database.close()
+
+    print(f"{args.backend} backend, {args.rows} tasks, median of {args.repeat} calls")
+    print(f"  {'statement':<28} {'unprepared':>11} {'prepared':>10} {'saved':>9}")
+    saved = 0.0
+    for label, _, _ in queries:
+        before, after = results[label, False], results[label, True]
+        saved += before - after
+        print(f"  {label:<28} {before:8.3f} ms {after:7.3f} ms {before - after:6.3f} ms")
+    print(f"  {'total':<28} {'':>11} {'':>10} {saved:6.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--backend", choices=["async", "threadpool"], default="async")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=500)
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("set DATABASE_URL or pass --dsn")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
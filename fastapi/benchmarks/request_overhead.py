@@ -0,0 +1,281 @@
+"""
+Fixed per-request costs of the hot helpers in main.py, without a database.
+
+Each case runs --number calls per round for --rounds rounds, after one warmup round, with
+the garbage collector off while timing (as timeit does). The report is the median and best
+per-call time. Cases:
+
+   jwt     create_access_token, jwt.decode, get_current_user with a cold and a warm
+           principal cache (the cold path runs one user lookup on a fake session)
+   model   TaskResponse/NoteResponse/PostResponse built from a database row
+   list    get_tasks/get_notes/get_posts called directly with filter, cursor, search and
+           fields combinations: parameter parsing, SQL building, statement lookup, ETag
+           and cache key, on a session that returns no rows
+   update  update_task (PUT) and patch_note (PATCH with If-Match) called directly: change
+           extraction, UPDATE building and the versioned response
+   bcrypt  pwd_context.verify and verify_password (through the hashing pool) at the
+           configured bcrypt cost, --bcrypt-number calls per round
+
+The workloads are fixed, so two runs differ only by code and machine. --output writes a
+JSON report with sorted keys, stamped with the commit, Python version and CPU count;
+--baseline prints the change against an earlier report. Log records the helpers emit
+are formatted as usual but written to /dev/null.
+
+Usage:
+    python benchmarks/request_overhead.py --output before.json
+    python benchmarks/request_overhead.py --output after.json --baseline before.json
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from fastapi import Response
+from fastapi.security import HTTPAuthorizationCredentials
+from starlette.requests import Request
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, APP_DIR)
+os.environ.setdefault("DATABASE_URL", "postgresql://unused")
+# Measure the handlers, not a cache that would answer every repeated list call
+os.environ["RESPONSE_CACHE_BACKEND"] = "none"
+
+import main as api  # noqa: E402
+from main import (  # noqa: E402
+    ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, SECRET_KEY, NoteResponse, NoteUpdate, PostResponse, TaskResponse,
+    TaskUpdate, create_access_token, encode_cursor, get_current_user, jwt, pwd_context, verify_password,
+)
+
+EMAIL = "bench@example.com"
+PASSWORD = "correct horse battery staple"
+CREATED = datetime(2025, 1, 1, 12, 0, 0)
+
+TASK_ROW = {
+    "id": 42, "title": "Write the quarterly report", "description": "Collect the numbers from every team " * 3,
+    "status": "pending", "priority": "high", "created_at": CREATED, "updated_at": CREATED,
+}
+NOTE_ROW = {
+    "id": 42, "title": "Meeting notes", "content": "Agreed to ship the new pagination " * 5,
+    "category": "work", "is_favorite": True, "created_at": CREATED, "updated_at": CREATED,
+}
+POST_ROW = {
+    "id": 42, "title": "Release notes", "content": "This release makes list endpoints faster " * 10,
+    "status": "published", "tags": ["release", "performance"], "view_count": 1234, "created_at": CREATED, "updated_at": CREATED,
+}
+USER_ROW = {"id": 1, "email": EMAIL, "full_name": "Bench User", "created_at": CREATED}
+
+
+class FakeSession:
+    """Stands in for db.Session: answers every statement at once, so only Python work is timed."""
+
+    def __init__(self, row=None, rows=()):
+        self.row = row
+        self.rows = list(rows)
+
+    async def fetchone(self, query, params=None):
+        return dict(self.row) if self.row is not None else None
+
+    async def fetchall(self, query, params=None):
+        return [dict(row) for row in self.rows]
+
+    async def execute(self, query, params=None):
+        return 1
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+
+def make_request(path: str, headers: dict = None) -> Request:
+    return Request({
+        "type": "http", "method": "GET", "path": path, "query_string": b"", "app": api.app,
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    })
+
+
+def list_cases(user: dict):
+    """(name, coroutine factory) for the list handlers; every query parameter is passed explicitly."""
+    db = FakeSession(row={"value": 7})
+    cursor = encode_cursor(TASK_ROW)
+
+    def tasks(**params):
+        defaults = dict(status_filter=None, priority_filter=None, search=None, search_mode="substring",
+                        limit=None, cursor=None, fields=None, view="full")
+        return lambda: api.get_tasks(make_request("/tasks"), Response(), user, db=db, **{**defaults, **params})
+
+    def notes(**params):
+        defaults = dict(category_filter=None, is_favorite=None, search=None, search_mode="substring",
+                        limit=None, cursor=None, fields=None, view="full")
+        return lambda: api.get_notes(make_request("/notes"), Response(), user, db=db, **{**defaults, **params})
+
+    def posts(**params):
+        defaults = dict(status_filter=None, search=None, search_mode="substring",
+                        limit=None, cursor=None, fields=None, view="full")
+        return lambda: api.get_posts(make_request("/posts"), Response(), user, db=db, **{**defaults, **params})
+
+    return [
+        ("list: get_tasks", tasks()),
+        ("list: get_tasks status+priority+limit", tasks(status_filter="pending", priority_filter="high", limit=50)),
+        ("list: get_tasks search+cursor", tasks(search="report", limit=50, cursor=cursor)),
+        ("list: get_tasks fulltext", tasks(search="quarterly report", search_mode="fulltext", limit=20)),
+        ("list: get_notes fields=id,title,preview", notes(fields="id,title,preview", is_favorite=True, limit=50)),
+        ("list: get_posts view=summary", posts(status_filter="published", view="summary", limit=50)),
+    ]
+
+
+def update_cases(user: dict):
+    task_db = FakeSession(row={**TASK_ROW, "version": 3})
+    note_db = FakeSession(row={**NOTE_ROW, "version": 3})
+    task_update = TaskUpdate(title="Write the yearly report", status="in_progress")
+    note_update = NoteUpdate.model_validate({"content": None, "is_favorite": False})
+    return [
+        ("update: update_task (PUT)", lambda: api.update_task(42, task_update, Response(), None, user, task_db)),
+        ("update: patch_note (PATCH, If-Match)", lambda: api.patch_note(42, note_update, Response(), '"3"', user, note_db)),
+    ]
+
+
+def auth_cases(token: str):
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    db = FakeSession(row=USER_ROW)
+    request = make_request("/user/profile")
+
+    async def cold():
+        api.token_cache.clear()
+        api.user_cache.clear()
+        return await get_current_user(request, credentials, db)
+
+    return [
+        ("jwt: get_current_user, cold cache", cold),
+        ("jwt: get_current_user, warm cache", lambda: get_current_user(request, credentials, db)),
+    ]
+
+
+def time_sync(func, number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return time.perf_counter() - start
+
+
+def time_async(loop, factory, number: int) -> float:
+    async def batch():
+        start = time.perf_counter()
+        for _ in range(number):
+            await factory()
+        return time.perf_counter() - start
+
+    return loop.run_until_complete(batch())
+
+
+def measure(run, number: int, rounds: int) -> dict:
+    run(number)
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        per_call = [run(number) / number for _ in range(rounds)]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {
+        "median_us": round(statistics.median(per_call) * 1e6, 3),
+        "best_us": round(min(per_call) * 1e6, 3),
+        "number": number,
+        "rounds": rounds,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def print_report(report: dict, baseline: dict = None):
+    def change(name):
+        if not baseline or name not in baseline.get("results", {}):
+            return ""
+        before = baseline["results"][name]["median_us"]
+        after = report["results"][name]["median_us"]
+        return f"{(after - before) / before * 100:+.0f}%" if before else ""
+
+    print(f"commit {report['commit'] or 'unknown'}, Python {report['python']}, bcrypt cost {report['bcrypt_rounds']}")
+    print(f"  {'case':<44}{'median':>14}{'best':>14}{'change':>8}")
+    for name, row in report["results"].items():
+        print(f"  {name:<44}{row['median_us']:>11.2f} us{row['best_us']:>11.2f} us{change(name):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=2000, help="calls per round")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--bcrypt-number", type=int, default=3, help="calls per round for the bcrypt cases")
+    parser.add_argument("--only", help="comma-separated case prefixes to run, e.g. jwt,list")
+    parser.add_argument("--output", default="request_overhead_report.json")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    args = parser.parse_args()
+
+    # Set by the lifespan in a running app; no read replicas here
+    api.app.state.db = None
+    api.app.state.replicas = None
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    password_hash = pwd_context.hash(PASSWORD)
+    token = create_access_token({"sub": EMAIL}, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    user = dict(USER_ROW)
+
+    sync_cases = [
+        ("jwt: create_access_token", lambda: create_access_token({"sub": EMAIL}, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))),
+        ("jwt: jwt.decode", lambda: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])),
+        ("model: TaskResponse(**row)", lambda: TaskResponse(**TASK_ROW)),
+        ("model: NoteResponse(**row)", lambda: NoteResponse(**NOTE_ROW)),
+        ("model: PostResponse(**row)", lambda: PostResponse(**POST_ROW)),
+    ]
+    async_cases = auth_cases(token) + list_cases(user) + update_cases(user)
+
+    runs = [(name, lambda n, func=func: time_sync(func, n), args.number) for name, func in sync_cases]
+    runs += [(name, lambda n, factory=factory: time_async(loop, factory, n), args.number) for name, factory in async_cases]
+    runs += [
+        ("bcrypt: pwd_context.verify", lambda n: time_sync(lambda: pwd_context.verify(PASSWORD, password_hash), n), args.bcrypt_number),
+        ("bcrypt: verify_password", lambda n: time_async(loop, lambda: verify_password(PASSWORD, password_hash), n), args.bcrypt_number),
+    ]
+    if args.only:
+        prefixes = tuple(prefix.strip() + ":" for prefix in args.only.split(","))
+        runs = [run for run in runs if run[0].startswith(prefixes)]
+
+    results = {}
+    for name, run, number in runs:
+        results[name] = measure(run, number, args.rounds)
+    api.password_hasher.shutdown()
+    loop.close()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "bcrypt_rounds": int(password_hash.split("$")[2]),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
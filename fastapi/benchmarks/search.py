@@ -0,0 +1,117 @@
+"""
+Search latency: ILIKE '%term%' vs the indexed full-text search mode.
+
+Seeds one throwaway user with ``--rows`` notes of random text, then times the two
+search paths the /notes endpoint uses for a handful of terms and prints median and
+p95 latency per mode. The user (and its notes) is deleted afterwards.
+
+Usage:
+    DATABASE_URL=postgresql://... python benchmarks/search.py --rows 200000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from db import create_database  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+VOCABULARY = 50000
+
+ILIKE_QUERY = """
+    SELECT id, title, content FROM notes
+    WHERE user_id = %s AND (title ILIKE %s OR content ILIKE %s)
+    ORDER BY created_at DESC, id DESC LIMIT 20
+"""
+
+FULLTEXT_QUERY = """
+    SELECT id, title, content,
+        ts_rank_cd(search_vector, websearch_to_tsquery('english', %s)) AS rank,
+        ts_headline('english', title || '. ' || coalesce(content, ''), websearch_to_tsquery('english', %s),
+                    'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5') AS headline
+    FROM notes
+    WHERE user_id = %s AND search_vector @@ websearch_to_tsquery('english', %s)
+    ORDER BY rank DESC, created_at DESC, id DESC LIMIT 20
+"""
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+async def seed(db, rows, words_per_note):
+    user = await db.fetchone(
+        "INSERT INTO users (email, password_hash, full_name) VALUES (%s, 'x', 'Search Benchmark') RETURNING id",
+        (f"bench-search-{uuid.uuid4().hex[:8]}@example.com",)
+    )
+    await db.execute(
+        """
+        INSERT INTO notes (user_id, title, content)
+        SELECT %s, 'note ' || g, body.text
+        FROM generate_series(1, %s) AS g,
+        LATERAL (
+            SELECT string_agg('word' || floor(random() * %s)::int, ' ') AS text
+            FROM generate_series(1, %s + 0 * g)
+        ) AS body
+        """,
+        (user["id"], rows, VOCABULARY, words_per_note)
+    )
+    await db.execute("ANALYZE notes")
+    await db.commit()
+    return user["id"]
+
+
+async def time_query(db, query, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await db.fetchall(query, params)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--words", type=int, default=60, help="words per note body")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--terms", default="word49999,word31337,absentterm")
+    args = parser.parse_args()
+    if not args.dsn:
+        parser.error("--dsn or DATABASE_URL is required")
+
+    database = create_database("async", args.dsn, min_size=1, max_size=1)
+    await database.open()
+    try:
+        async with database.session() as db:
+            await migrate(db)
+            print(f"Seeding {args.rows} notes...")
+            user_id = await seed(db, args.rows, args.words)
+            try:
+                results = {"ilike": [], "fulltext": []}
+                for term in args.terms.split(","):
+                    pattern = f"%{term}%"
+                    results["ilike"] += await time_query(db, ILIKE_QUERY, (user_id, pattern, pattern), args.repeat)
+                    results["fulltext"] += await time_query(
+                        db, FULLTEXT_QUERY, (term, term, user_id, term), args.repeat
+                    )
+                print(f"{'mode':<10}{'median ms':>12}{'p95 ms':>10}")
+                for mode, timings in results.items():
+                    print(f"{mode:<10}{statistics.median(timings) * 1000:>12.2f}{percentile(timings, 95) * 1000:>10.2f}")
+            finally:
+                await db.rollback()
+                await db.execute("DELETE FROM users WHERE id = %s", (user_id,))
+                await db.commit()
+    finally:
+        await database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""
+Cost of turning a 10k-row task list into response bytes.
+
+Compares the pre-orjson handler path (build a TaskResponse per row, then let FastAPI
+validate and serialize the response_model), a precompiled pydantic serializer, and
+the orjson path the read endpoints use now, both from dict rows and from tuple rows
+zipped with the column names. No database is needed.
+
+Usage:
+    python benchmarks/serialization.py --rows 10000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+import orjson
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import TypeAdapter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("DATABASE_URL", "postgresql://unused")
+
+from main import TASK_COLUMNS, TaskResponse  # noqa: E402
+
+COLUMNS = TASK_COLUMNS.split(", ")
+
+
+def make_rows(count: int) -> List[tuple]:
+    start = datetime(2025, 1, 1)
+    return [
+        (i, f"Task {i}", "Write the quarterly report " * 4, "pending", "medium",
+         start + timedelta(seconds=i), start + timedelta(seconds=i, microseconds=i))
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    tuples = make_rows(args.rows)
+    dicts = [dict(zip(COLUMNS, row)) for row in tuples]
+    field = create_response_field(name="response", type_=List[TaskResponse])
+    adapter = TypeAdapter(List[TaskResponse])
+    loop = asyncio.new_event_loop()
+
+    def response_model_path():
+        models = [TaskResponse(**row) for row in dicts]
+        content = loop.run_until_complete(serialize_response(field=field, response_content=models, is_coroutine=True))
+        return JSONResponse(content).body
+
+    def pydantic_path():
+        return adapter.dump_json([TaskResponse(**row) for row in dicts])
+
+    def orjson_dicts():
+        return orjson.dumps(dicts)
+
+    def orjson_tuples():
+        return orjson.dumps([dict(zip(COLUMNS, row)) for row in tuples])
+
+    paths = [
+        ("models + response_model (before)", response_model_path),
+        ("models + TypeAdapter.dump_json", pydantic_path),
+        ("orjson from dict rows (now)", orjson_dicts),
+        ("orjson from tuple rows + zip", orjson_tuples),
+    ]
+    # Same JSON document whichever path produced it
+    reference = orjson.loads(orjson_dicts())
+    for name, func in paths:
+        assert orjson.loads(func()) == reference, name
+
+    print(f"{args.rows} rows, median of {args.repeat} runs")
+    baseline = None
+    for name, func in paths:
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        median = statistics.median(timings) * 1000
+        baseline = baseline or median
+        print(f"  {name:<34} {median:8.2f} ms  {baseline / median:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
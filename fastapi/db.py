@@ -0,0 +1,699 @@
+import itertools
+import logging
+import re
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Sequence, Set, Union
+
+import anyio
+import psycopg2
+from anyio import to_thread
+from psycopg2 import extensions
+
+from metrics import FAST_BUCKETS, Histogram
+from tracing import add_span, tracer
+
+try:
+    import psycopg
+    from psycopg.rows import dict_row
+    from psycopg_pool import AsyncConnectionPool
+    from psycopg_pool import PoolTimeout as AsyncPoolTimeout
+except ImportError:  # psycopg 3 is optional; the threadpool backend only needs psycopg2
+    psycopg = None
+
+logger = logging.getLogger(__name__)
+
+# Server-side cursor names only need to be unique per connection
+_cursor_names = (f"stream_{n}" for n in itertools.count())
+
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Statement execution time, by statement label.", ["statement"], buckets=FAST_BUCKETS
+)
+DB_ACQUIRE_SECONDS = Histogram(
+    "db_connection_acquire_seconds", "Time spent waiting to check out a pooled connection.", buckets=FAST_BUCKETS
+)
+# Queries passed as plain strings rather than Statements
+_unlabeled = DB_QUERY_SECONDS.labels("other")
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out before the pool timeout."""
+
+
+class ConnectError(Exception):
+    """Raised when a new database connection could not be established."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections.
+
+    Connections are opened lazily up to ``max_size``; callers block for at most
+    ``timeout`` seconds waiting for one to be returned. Connections older than
+    ``max_lifetime`` seconds are recycled, and with ``check_on_borrow`` every
+    checkout is validated with a ``SELECT 1`` so that a connection dropped by the
+    server is replaced instead of failing the request.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = 1,
+        max_size: int = 10,
+        timeout: float = 30.0,
+        max_lifetime: float = 3600.0,
+        check_on_borrow: bool = True,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: require 0 <= min_size <= max_size and max_size >= 1")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_on_borrow = check_on_borrow
+
+        self._idle: Deque[extensions.connection] = deque()
+        self._born: Dict[int, float] = {}
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    # Lifecycle
+    def open(self):
+        """Eagerly open ``min_size`` connections."""
+        for _ in range(self.min_size):
+            with self._cond:
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append(conn)
+        logger.info(f"Connection pool opened (min={self.min_size}, max={self.max_size})")
+
+    def close(self):
+        """Close every idle connection and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn)
+        logger.info("Connection pool closed")
+
+    # Checkout / return
+    def getconn(self) -> extensions.connection:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed")
+                    if self._idle:
+                        conn = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(f"No connection available within {self.timeout}s")
+                    self._cond.wait(remaining)
+
+            if conn is None:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+
+            if self._expired(conn) or (self.check_on_borrow and not self._healthy(conn)):
+                self._discard(conn)
+                continue
+            return conn
+
+    def putconn(self, conn: extensions.connection, discard: bool = False):
+        if not discard and not conn.closed:
+            if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                # Never hand a connection with an open (or failed) transaction to the next request
+                try:
+                    conn.rollback()
+                except Exception:
+                    discard = True
+
+        with self._cond:
+            keep = not (discard or conn.closed or self._closed or self._expired(conn))
+            if keep:
+                self._idle.append(conn)
+                self._cond.notify()
+        if not keep:
+            self._discard(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[extensions.connection]:
+        """Check out a connection and always return it, even if the block raises."""
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"size": self._size, "idle": len(self._idle), "max_size": self.max_size}
+
+    # Internals
+    def _connect(self) -> extensions.connection:
+        conn = psycopg2.connect(self.dsn)
+        self._born[id(conn)] = time.monotonic()
+        return conn
+
+    def _expired(self, conn: extensions.connection) -> bool:
+        born = self._born.get(id(conn))
+        return born is not None and time.monotonic() - born > self.max_lifetime
+
+    def _healthy(self, conn: extensions.connection) -> bool:
+        if conn.closed:
+            return False
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"Discarding broken pooled connection: {e}")
+            return False
+
+    def _discard(self, conn: extensions.connection):
+        self._born.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+
+# Prepared statements
+#
+# The hot-path queries are the same few SQL strings on every request. A Statement names
+# one of them; sessions prepare it the first time it runs on a pooled connection and from
+# then on only bind and execute it, skipping the server's parse and plan steps. psycopg 3
+# does this at the protocol level (``prepare=True``); psycopg2 has no such API, so the
+# threadpool backend issues PREPARE / EXECUTE itself.
+
+_placeholders = re.compile(r"%%|%s")
+
+
+class Statement:
+    """
+    A registered SQL string (psycopg ``%s`` placeholders), its server-side name, and the
+    label its execution time is reported under.
+    """
+
+    __slots__ = ("registry", "name", "label", "sql", "server_sql", "param_count", "timer")
+
+    def __init__(self, registry: "StatementRegistry", name: str, sql: str, label: str = "other"):
+        self.registry = registry
+        self.name = name
+        self.label = label
+        self.sql = sql
+        self.timer = DB_QUERY_SECONDS.labels(label)
+        # PREPARE takes $1, $2, ... placeholders and no client-side escaping
+        counter = itertools.count(1)
+        self.server_sql = _placeholders.sub(lambda m: "%" if m.group() == "%%" else f"${next(counter)}", sql)
+        self.param_count = next(counter) - 1
+
+    def __repr__(self):
+        return f"Statement({self.name!r})"
+
+
+class StatementRegistry:
+    """
+    The statements sessions may prepare, and which of them each connection has prepared.
+
+    Fixed queries are registered once at import time. Queries assembled per request (list
+    filters, partial updates) come in a bounded number of shapes and are registered on
+    first use; past ``max_statements`` new shapes simply run unprepared, so a stream of
+    unusual SQL cannot grow every connection's server-side cache without bound.
+    """
+
+    def __init__(self, enabled: bool = True, max_statements: int = 256):
+        self.enabled = enabled
+        self.max_statements = max_statements
+        self._statements: Dict[str, Statement] = {}
+        self._prepared: "weakref.WeakKeyDictionary[Any, Set[str]]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+        self.prepares = 0
+        self.prepared_executions = 0
+        self.unprepared_executions = 0
+        self.overflow = 0
+
+    def get(self, sql: str, label: str = "other") -> Union[Statement, str]:
+        """
+        Return the Statement for ``sql``, registering it under ``label`` if there is room;
+        otherwise ``sql`` itself. Labels name a query family ("tasks.list"), not a shape.
+        """
+        statement = self._statements.get(sql)
+        if statement is not None:
+            return statement
+        with self._lock:
+            statement = self._statements.get(sql)
+            if statement is None:
+                if len(self._statements) >= self.max_statements:
+                    self.overflow += 1
+                    return sql
+                statement = Statement(self, f"stmt_{len(self._statements)}", sql, label)
+                self._statements[sql] = statement
+            return statement
+
+    register = get
+
+    def is_prepared(self, conn, statement: Statement) -> bool:
+        prepared = self._prepared.get(conn)
+        return prepared is not None and statement.name in prepared
+
+    def mark_prepared(self, conn, statement: Statement):
+        with self._lock:
+            names = self._prepared.setdefault(conn, set())
+            if statement.name not in names:
+                names.add(statement.name)
+                self.prepares += 1
+
+    def executed(self, prepared: bool):
+        with self._lock:
+            if prepared:
+                self.prepared_executions += 1
+            else:
+                self.unprepared_executions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            executions = self.prepared_executions + self.unprepared_executions
+            return {
+                "enabled": self.enabled,
+                "statements": len(self._statements),
+                "max_statements": self.max_statements,
+                "overflow": self.overflow,
+                "prepares": self.prepares,
+                "prepared_executions": self.prepared_executions,
+                # Executions that skipped parse and plan because the statement was already prepared
+                "reuse_ratio": round((self.prepared_executions - self.prepares) / executions, 4) if executions else 0.0,
+            }
+
+
+statements = StatementRegistry()
+
+
+# Async data-access layer
+#
+# Handlers talk to a Session, which exposes awaitable fetchone/fetchall/execute
+# and explicit commit/rollback. Two backends implement it:
+#   - "async": native psycopg 3 connections from an AsyncConnectionPool
+#   - "threadpool": the psycopg2 ConnectionPool above, with every blocking call
+#     run in a worker thread bounded by a CapacityLimiter
+# Either way the event loop is never blocked on the database.
+
+class Session:
+    """One checked-out connection, scoped to a single request."""
+
+    # Set while explain() runs, so its own statements are neither timed nor explained
+    _explaining = False
+    _after_commit = None
+
+    async def fetchone(self, query: Union[Statement, str], params: Optional[Sequence[Any]] = None) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def fetchall(self, query: Union[Statement, str], params: Optional[Sequence[Any]] = None) -> List[dict]:
+        raise NotImplementedError
+
+    async def execute(self, query: Union[Statement, str], params: Optional[Sequence[Any]] = None) -> int:
+        """Run a statement and return the number of affected rows."""
+        raise NotImplementedError
+
+    def stream(self, query: str, params: Optional[Sequence[Any]] = None, chunk_size: int = 1000) -> AsyncIterator[List[dict]]:
+        """
+        Yield the result in lists of at most ``chunk_size`` rows from a named server-side
+        cursor, so memory stays bounded however large the result is. Must run inside the
+        session's transaction; close the iterator (``aclose()``) if it is abandoned early.
+        """
+        raise NotImplementedError
+
+    async def commit(self):
+        raise NotImplementedError
+
+    async def rollback(self):
+        raise NotImplementedError
+
+    def after_commit(self, callback):
+        """Await ``callback()`` after every successful commit of this session; never after a rollback."""
+        if self._after_commit is None:
+            self._after_commit = []
+        self._after_commit.append(callback)
+
+    async def _committed(self):
+        for callback in self._after_commit or ():
+            await callback()
+
+    async def set_autocommit(self, enabled: bool):
+        """Run each statement in its own transaction (for CREATE INDEX CONCURRENTLY). Only outside a transaction."""
+        raise NotImplementedError
+
+    async def _finished(self, query: Union[Statement, str], params, start: float):
+        """Report one completed statement to the metrics, the request trace and the slow-query log."""
+        if self._explaining:
+            return
+        duration = time.perf_counter() - start
+        if isinstance(query, Statement):
+            label, sql, timer = query.label, query.sql, query.timer
+        else:
+            label, sql, timer = "other", query, _unlabeled
+        timer.observe(duration)
+        add_span("db.query", start, duration, statement=label)
+        if duration >= tracer.slow_query_seconds:
+            await tracer.slow_query(self, label, sql, params, duration)
+
+    async def explain(self, sql: str, params: Optional[Sequence[Any]] = None) -> Any:
+        """
+        Run ``EXPLAIN (ANALYZE, BUFFERS)`` for a read-only statement and return the JSON plan.
+        A savepoint keeps a failing EXPLAIN from aborting the caller's transaction.
+        """
+        self._explaining = True
+        try:
+            await self.execute("SAVEPOINT trace_explain")
+            try:
+                row = await self.fetchone(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", params)
+            finally:
+                await self.execute("ROLLBACK TO SAVEPOINT trace_explain")
+            await self.execute("RELEASE SAVEPOINT trace_explain")
+        finally:
+            self._explaining = False
+        return next(iter(row.values()))
+
+
+class AsyncSession(Session):
+    def __init__(self, conn: "psycopg.AsyncConnection"):
+        self.conn = conn
+
+    async def _execute(self, cursor, query, params):
+        start = time.perf_counter()
+        if not isinstance(query, Statement):
+            # Left to psycopg's own policy (prepare after prepare_threshold executions)
+            await cursor.execute(query, params)
+        else:
+            registry = query.registry
+            await cursor.execute(query.sql, params, prepare=registry.enabled)
+            if registry.enabled:
+                registry.mark_prepared(self.conn, query)
+            registry.executed(registry.enabled)
+        await self._finished(query, params, start)
+
+    async def fetchone(self, query, params=None):
+        async with self.conn.cursor() as cursor:
+            await self._execute(cursor, query, params)
+            return await cursor.fetchone()
+
+    async def fetchall(self, query, params=None):
+        async with self.conn.cursor() as cursor:
+            await self._execute(cursor, query, params)
+            return await cursor.fetchall()
+
+    async def execute(self, query, params=None):
+        async with self.conn.cursor() as cursor:
+            await self._execute(cursor, query, params)
+            return cursor.rowcount
+
+    async def stream(self, query, params=None, chunk_size=1000):
+        async with self.conn.cursor(name=next(_cursor_names)) as cursor:
+            await cursor.execute(query, params)
+            while True:
+                rows = await cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+
+    async def commit(self):
+        await self.conn.commit()
+        await self._committed()
+
+    async def rollback(self):
+        await self.conn.rollback()
+
+    async def set_autocommit(self, enabled):
+        await self.conn.set_autocommit(enabled)
+
+
+class ThreadedSession(Session):
+    def __init__(self, conn: extensions.connection, limiter: anyio.CapacityLimiter):
+        self.conn = conn
+        self._limiter = limiter
+
+    async def _run(self, func, *args):
+        return await to_thread.run_sync(func, *args, limiter=self._limiter)
+
+    # Plain tuple cursors zipped with the column names: the same dicts as RealDictCursor,
+    # without its per-column Python bookkeeping on every row
+    @staticmethod
+    def _names(cursor) -> List[str]:
+        return [column[0] for column in cursor.description]
+
+    def _run_query(self, cursor, query, params):
+        if not isinstance(query, Statement):
+            cursor.execute(query, params)
+            return
+        registry = query.registry
+        if not registry.enabled:
+            cursor.execute(query.sql, params)
+            registry.executed(False)
+            return
+        if not registry.is_prepared(self.conn, query):
+            # Prepared statements belong to the server session, so they outlive a rollback
+            cursor.execute(f"PREPARE {query.name} AS {query.server_sql}")
+            registry.mark_prepared(self.conn, query)
+        if query.param_count:
+            cursor.execute(f"EXECUTE {query.name} ({', '.join(['%s'] * query.param_count)})", params)
+        else:
+            cursor.execute(f"EXECUTE {query.name}")
+        registry.executed(True)
+
+    def _fetchone(self, query, params):
+        with self.conn.cursor() as cursor:
+            self._run_query(cursor, query, params)
+            row = cursor.fetchone()
+            return dict(zip(self._names(cursor), row)) if row is not None else None
+
+    def _fetchall(self, query, params):
+        with self.conn.cursor() as cursor:
+            self._run_query(cursor, query, params)
+            names = self._names(cursor)
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def _execute(self, query, params):
+        with self.conn.cursor() as cursor:
+            self._run_query(cursor, query, params)
+            return cursor.rowcount
+
+    # Timed around the worker-thread hop, since waiting for a thread is database time for the request
+    async def fetchone(self, query, params=None):
+        start = time.perf_counter()
+        row = await self._run(self._fetchone, query, params)
+        await self._finished(query, params, start)
+        return row
+
+    async def fetchall(self, query, params=None):
+        start = time.perf_counter()
+        rows = await self._run(self._fetchall, query, params)
+        await self._finished(query, params, start)
+        return rows
+
+    async def execute(self, query, params=None):
+        start = time.perf_counter()
+        rowcount = await self._run(self._execute, query, params)
+        await self._finished(query, params, start)
+        return rowcount
+
+    async def stream(self, query, params=None, chunk_size=1000):
+        cursor = self.conn.cursor(name=next(_cursor_names))
+        try:
+            await self._run(cursor.execute, query, params)
+            while True:
+                rows = await self._run(cursor.fetchmany, chunk_size)
+                if not rows:
+                    break
+                names = self._names(cursor)
+                yield [dict(zip(names, row)) for row in rows]
+        finally:
+            await self._run(cursor.close)
+
+    async def commit(self):
+        await self._run(self.conn.commit)
+        await self._committed()
+
+    async def rollback(self):
+        await self._run(self.conn.rollback)
+
+    async def set_autocommit(self, enabled):
+        await self._run(setattr, self.conn, "autocommit", enabled)
+
+
+def _acquired(start: float):
+    duration = time.perf_counter() - start
+    DB_ACQUIRE_SECONDS.observe(duration)
+    add_span("db.acquire", start, duration)
+
+
+class Database:
+    """Owns the connection pool for one backend and hands out Sessions."""
+
+    async def open(self):
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+    def session(self) -> "AsyncIterator[Session]":
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class AsyncDatabase(Database):
+    backend = "async"
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10, timeout: float = 30.0,
+                 max_lifetime: float = 3600.0, check_on_borrow: bool = True):
+        if psycopg is None:
+            raise RuntimeError("The async database backend requires psycopg 3: pip install 'psycopg[binary,pool]'")
+        self.pool = AsyncConnectionPool(
+            dsn,
+            min_size=min_size,
+            max_size=max_size,
+            timeout=timeout,
+            max_lifetime=max_lifetime,
+            check=AsyncConnectionPool.check_connection if check_on_borrow else None,
+            kwargs={"row_factory": dict_row},
+            configure=self._configure,
+            open=False,
+        )
+
+    @staticmethod
+    async def _configure(conn: "psycopg.AsyncConnection"):
+        # Room for every registered statement on top of psycopg's automatic preparation
+        conn.prepared_max += statements.max_statements
+
+    async def open(self):
+        await self.pool.open(wait=True)
+        logger.info(f"Async connection pool opened (min={self.pool.min_size}, max={self.pool.max_size})")
+
+    async def close(self):
+        await self.pool.close()
+        logger.info("Async connection pool closed")
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[Session]:
+        start = time.perf_counter()
+        try:
+            conn = await self.pool.getconn()
+        except AsyncPoolTimeout as e:
+            raise PoolTimeout(str(e)) from e
+        except psycopg.OperationalError as e:
+            raise ConnectError(str(e)) from e
+        finally:
+            _acquired(start)
+        try:
+            yield AsyncSession(conn)
+        finally:
+            if conn.info.transaction_status != psycopg.pq.TransactionStatus.IDLE:
+                try:
+                    await conn.rollback()
+                except Exception:
+                    pass
+            await self.pool.putconn(conn)
+
+    def stats(self) -> dict:
+        pool_stats = self.pool.get_stats()
+        return {
+            "backend": self.backend,
+            "size": pool_stats.get("pool_size", 0),
+            "idle": pool_stats.get("pool_available", 0),
+            "max_size": self.pool.max_size,
+        }
+
+
+class ThreadedDatabase(Database):
+    backend = "threadpool"
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10, timeout: float = 30.0,
+                 max_lifetime: float = 3600.0, check_on_borrow: bool = True, threads: Optional[int] = None):
+        self.pool = ConnectionPool(
+            dsn,
+            min_size=min_size,
+            max_size=max_size,
+            timeout=timeout,
+            max_lifetime=max_lifetime,
+            check_on_borrow=check_on_borrow,
+        )
+        self.threads = threads or max_size
+        self.limiter: Optional[anyio.CapacityLimiter] = None
+        self._slots: Optional[anyio.Semaphore] = None
+
+    async def open(self):
+        # Never run more blocking database calls at once than there are connections to serve them
+        self.limiter = anyio.CapacityLimiter(self.threads)
+        # Requests queue for a connection on the event loop, not inside a worker thread: a
+        # thread blocked in getconn() would hold a slot needed to return a connection.
+        self._slots = anyio.Semaphore(self.pool.max_size)
+        await to_thread.run_sync(self.pool.open, limiter=self.limiter)
+
+    async def close(self):
+        await to_thread.run_sync(self.pool.close, limiter=self.limiter)
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[Session]:
+        start = time.perf_counter()
+        try:
+            with anyio.fail_after(self.pool.timeout):
+                await self._slots.acquire()
+        except TimeoutError as e:
+            _acquired(start)
+            raise PoolTimeout(f"No connection available within {self.pool.timeout}s") from e
+        try:
+            try:
+                conn = await to_thread.run_sync(self.pool.getconn, limiter=self.limiter)
+            except psycopg2.OperationalError as e:
+                raise ConnectError(str(e)) from e
+            finally:
+                _acquired(start)
+            try:
+                yield ThreadedSession(conn, self.limiter)
+            finally:
+                await to_thread.run_sync(self.pool.putconn, conn, limiter=self.limiter)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {"backend": self.backend, **self.pool.stats()}
+
+
+def create_database(backend: str, dsn: str, **options) -> Database:
+    if backend == "async":
+        options.pop("threads", None)
+        return AsyncDatabase(dsn, **options)
+    if backend == "threadpool":
+        return ThreadedDatabase(dsn, **options)
+    raise ValueError(f"Unknown database backend: {backend!r} (expected 'async' or 'threadpool')")
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# bcrypt at the default cost takes a few hundred milliseconds
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_duration_seconds", "bcrypt time per call, excluding queueing.", ["operation"],
+    buckets=(0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.5),
+)
+
+
+class HasherBusy(Exception):
+    """Raised when a hashing slot did not free up within the queue timeout."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated, size-limited thread pool.
+
+    bcrypt releases the GIL, so threads give real parallelism while keeping the
+    event loop free. At most ``workers`` hashes run at once; callers wait up to
+    ``queue_timeout`` seconds for a slot and get HasherBusy after that, so a
+    login burst is shed instead of starving the rest of the API.
+    """
+
+    def __init__(self, context: CryptContext, workers: int = 4, queue_timeout: float = 5.0):
+        self.context = context
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = asyncio.Semaphore(workers)
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(self.context.verify, plain_password, hashed_password)
+
+    async def _run(self, func, *args):
+        acquired = False
+        try:
+            try:
+                async with asyncio.timeout(self.queue_timeout):
+                    await self._slots.acquire()
+                    acquired = True
+            except TimeoutError:
+                with self._lock:
+                    self.rejected += 1
+                logger.warning(f"Password hashing queue full; rejected after {self.queue_timeout}s")
+                raise HasherBusy(f"No hashing slot available within {self.queue_timeout}s")
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._timed, func, *args)
+        finally:
+            # Set as soon as the permit is granted, so a timeout or cancellation that lands
+            # right after the acquire still gives it back
+            if acquired:
+                self._slots.release()
+
+    def _timed(self, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            PASSWORD_HASH_SECONDS.labels(func.__name__).observe(elapsed)
+            with self._lock:
+                self.calls += 1
+                self.total_seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+            logger.debug(f"{func.__name__} took {elapsed * 1000:.1f}ms")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "calls": self.calls,
+                "rejected": self.rejected,
+                "avg_ms": round(self.total_seconds / self.calls * 1000, 1) if self.calls else 0.0,
+                "max_ms": round(self.max_seconds * 1000, 1),
+            }
@@ -0,0 +1,228 @@
+"""
+Logging that stays off the request path: a bounded queue, JSON or text output, sampling
+and per-message-type rate limits.
+
+``configure_logging`` puts a single QueueLogHandler on the root logger, and on uvicorn's
+loggers in place of their own stream handlers. A caller's only
+cost is the level check, the filters and putting the record on the queue. A background
+thread (logging.handlers.QueueListener) formats the record and writes it to stderr. When
+the queue is full, records are dropped and counted. The caller never waits on a slow
+terminal or log shipper.
+
+Structured data goes in ``extra``:
+
+    logger.warning("slow_query", extra={"event": "slow_query", "fields": {"duration_ms": 812.4}})
+
+``event`` names the message type. ``fields`` is merged into the JSON object, or appended
+as JSON after the message in text output. Sampling rates are looked up by event name, then
+by logger name. Rate limits apply per event, or per call site for records without one.
+Records suppressed by a rate limit are counted in ``suppressed`` on the next record of that
+type that gets through.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import orjson
+
+TEXT_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+# uvicorn gives these their own StreamHandlers, which would write on the event loop thread
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, event and fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        event = getattr(record, "event", None)
+        if event is not None:
+            entry["event"] = event
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return orjson.dumps(entry, default=str).decode()
+
+
+class TextFormatter(logging.Formatter):
+    """The plain ``LEVEL:logger:message`` format, with structured fields appended as JSON."""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        line = super().formatMessage(record)
+        fields = getattr(record, "fields", None)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            fields = {**(fields or {}), "suppressed": suppressed}
+        if fields:
+            line += " " + orjson.dumps(fields, default=str).decode()
+        return line
+
+
+class LogLimiter(logging.Filter):
+    """
+    Sampling and token-bucket rate limiting per message type.
+
+    ``sample_rates`` maps an event or logger name to the share (0-1) of its records to
+    keep. ``rate_limit`` is the sustained number of records per second allowed per
+    message type, with bursts of up to ``burst`` records; 0 disables rate limiting.
+    """
+
+    def __init__(self, sample_rates: Optional[Dict[str, float]] = None, rate_limit: float = 0.0, burst: Optional[float] = None):
+        super().__init__()
+        self.sample_rates = dict(sample_rates or {})
+        self.rate_limit = rate_limit
+        self.burst = burst if burst is not None else max(rate_limit, 1.0)
+        # message type -> [tokens, last refill, suppressed since the last record let through]
+        self._buckets: Dict[object, list] = {}
+        self._lock = threading.Lock()
+        self.sampled_out = 0
+        self.rate_limited = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if self.sample_rates:
+            rate = self.sample_rates.get(event) if event is not None else None
+            if rate is None:
+                rate = self.sample_rates.get(record.name)
+            if rate is not None and random.random() >= rate:
+                self.sampled_out += 1
+                return False
+        if self.rate_limit <= 0:
+            return True
+
+        key = event if event is not None else (record.name, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate_limit)
+                bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                self.rate_limited += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class QueueLogHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, handler: logging.Handler, queue_size: int = 10000):
+        super().__init__(queue.Queue(queue_size))
+        self.listener = logging.handlers.QueueListener(self.queue, handler, respect_handler_level=True)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments now, since they may change before the listener runs. Leave the
+        # formatting to the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        self.listener.start()
+        # Write out whatever is still queued when the process exits
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def stats(self) -> dict:
+        stats = {"queued": self.queue.qsize(), "dropped": self.dropped, "sampled_out": 0, "rate_limited": 0}
+        for limiter in self.filters:
+            if isinstance(limiter, LogLimiter):
+                stats["sampled_out"] += limiter.sampled_out
+                stats["rate_limited"] += limiter.rate_limited
+        return stats
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse ``"slow_query=0.1,main.requests=0.01"`` into ``{name: rate}``."""
+    rates = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def configure_logging(level: str = "INFO", fmt: str = "text", queue_size: int = 10000,
+                      sample_rates: Optional[Dict[str, float]] = None, rate_limit: float = 0.0,
+                      stream=None) -> QueueLogHandler:
+    """Replace the root logger's handlers with a started QueueLogHandler and return it."""
+    if fmt not in ("text", "json"):
+        raise ValueError(f"Unknown log format: {fmt!r}")
+    output = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    output.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+
+    handler = QueueLogHandler(output, queue_size)
+    if sample_rates or rate_limit > 0:
+        handler.addFilter(LogLimiter(sample_rates, rate_limit))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+        existing.close()
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    route_loggers(handler)
+    handler.start()
+    return handler
+
+
+def route_loggers(handler: logging.Handler, names=UVICORN_LOGGERS):
+    """
+    Replace the handlers of the named loggers with ``handler``.
+
+    uvicorn configures its loggers when its Config is created, which may be after the app
+    is imported, so this is safe to call again at startup. Loggers without handlers are
+    left alone: they already propagate to the root, or were silenced (``--no-access-log``).
+    """
+    for name in names:
+        target = logging.getLogger(name)
+        if not target.handlers or target.handlers == [handler]:
+            continue
+        for existing in target.handlers[:]:
+            target.removeHandler(existing)
+        target.addHandler(handler)
+        target.propagate = False
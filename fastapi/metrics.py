@@ -0,0 +1,263 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+A deliberately small subset of what prometheus_client offers: counters, gauges and
+histograms with fixed label sets, plus callback collectors that read values other
+objects already keep (cache and pool stats) at scrape time. Recording is a dict lookup,
+a bisect and an increment under a lock, so it can sit on every request and query.
+
+Metrics are per process; with several workers, scrape each one or aggregate by instance.
+Labels must come from small fixed sets (route templates, statement labels, cache names),
+never from ids, emails or raw paths.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; request latency spans cached reads to slow exports
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Seconds; single statements and connection checkouts are mostly sub-millisecond
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Optional["Registry"] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values: str):
+        """Return the child for one combination of label values, creating it on first use."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("upper_bounds", "counts", "sum", "_lock")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        # One slot per bucket plus the implicit +Inf bucket
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.upper_bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child: _HistogramValue):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional["Registry"] = None):
+        self.upper_bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.upper_bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.upper_bounds + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="{}"'.format(_format_value(bound))
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, values)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, values)} {cumulative}"
+
+
+class CallbackMetric(Metric):
+    """
+    Values computed at scrape time by ``collect``, which returns ``{label values: value}``.
+
+    Used for numbers that already live elsewhere (cache hit counters, pool sizes), so
+    the hot path pays nothing to expose them.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], collect: Callable[[], Dict[Tuple[str, ...], float]],
+                 kind: str = "gauge", registry: Optional["Registry"] = None):
+        self.kind = kind
+        self.collect = collect
+        super().__init__(name, documentation, labelnames, registry)
+
+    def samples(self):
+        for values, value in self.collect().items():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time from request start to the last response byte.", ["method", "route", "status"]
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being served.")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency by method, route template and status, and the
+    number of requests in flight.
+
+    The route label is the matched path template (``/tasks/{task_id}``), read from the
+    scope after routing; requests that match no route share the label ``unmatched``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"], route.path if route is not None else "unmatched", str(status_code)
+            ).observe(time.perf_counter() - start)
@@ -0,0 +1,223 @@
+"""
+Rate limiting for the credential endpoints.
+
+Every attempt at /auth/login or /auth/signup takes one token from two buckets: one for
+the client IP and one for the submitted email. A bucket refills at ``per_minute`` tokens
+a minute and holds up to ``burst`` tokens. An attempt finding either bucket empty is
+rejected with 429 and Retry-After. The check runs before a connection is checked out or
+bcrypt is run, so a credential-stuffing burst costs a dictionary lookup per attempt
+instead of a query and a hash.
+
+Backends:
+    memory      token buckets in one LRU-evicted dict of ``(tokens, updated_at)`` pairs,
+                at most ``max_keys`` of them (per worker)
+    redis       the same token buckets shared by all workers, each a hash refilled and
+                taken from atomically by a Lua script
+    fake-redis  in-process stand-in for the redis backend, for local runs and tests
+    none        limiting disabled
+
+If the shared backend fails, the attempt is allowed. An outage then costs the limit, not
+the login endpoint.
+"""
+import logging
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from response_cache import FakeRedis
+
+logger = logging.getLogger(__name__)
+
+
+class Limit:
+    __slots__ = ("name", "rate", "burst")
+
+    def __init__(self, name: str, per_minute: float, burst: int):
+        self.name = name
+        self.rate = per_minute / 60
+        self.burst = burst
+
+    def validate(self):
+        # Both backends divide by the rate, and a bucket below one token rejects everything
+        if self.rate <= 0 or self.burst < 1:
+            raise ValueError(
+                f"Rate limit {self.name!r} needs per_minute > 0 and burst >= 1 (got {self.rate * 60:g}, {self.burst});"
+                " use RATE_LIMIT_BACKEND=none to disable limiting"
+            )
+
+
+class RateLimitBackend(ABC):
+    name = "backend"
+
+    @abstractmethod
+    async def take(self, key: str, limit: Limit) -> float:
+        """Take one token from ``key``'s bucket. Return 0 if allowed, else seconds until a token is available."""
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryBackend(RateLimitBackend):
+    """
+    Token buckets keyed by string, least recently used first.
+
+    Evicting a bucket only forgets attempts it has not yet refilled. The idle buckets,
+    which are nearly full anyway, go first.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, limit: Limit) -> float:
+        now = time.monotonic()
+        with self._lock:
+            # Popping and reinserting moves the key to the most recently used end
+            entry = self._buckets.pop(key, None)
+            tokens = limit.burst if entry is None else min(limit.burst, entry[0] + (now - entry[1]) * limit.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        return 0.0 if allowed else (1 - tokens) / limit.rate
+
+    def stats(self) -> dict:
+        return {"keys": len(self._buckets), "max_keys": self.max_keys, "evictions": self.evictions}
+
+
+# KEYS[1] is the bucket, ARGV is burst and rate per second. Redis's own clock times the
+# refill, so workers with skewed clocks still share one bucket. A bucket expires once it
+# would have refilled completely, which is the same as not existing. The result is a
+# string because Redis truncates Lua numbers to integers.
+TAKE_SCRIPT = """
+local burst = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = burst
+if state[1] then
+    tokens = math.min(burst, tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * rate)
+end
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return tostring(retry_after)
+"""
+
+
+@FakeRedis.emulate(TAKE_SCRIPT)
+async def _fake_take(client: FakeRedis, keys, args) -> bytes:
+    burst, rate = float(args[0]), float(args[1])
+    now = time.time()
+    state = await client.get(keys[0])
+    tokens = burst
+    if state is not None:
+        stored, updated = map(float, state.split())
+        tokens = min(burst, stored + max(0.0, now - updated) * rate)
+    retry_after = 0.0
+    if tokens >= 1:
+        tokens -= 1
+    else:
+        retry_after = (1 - tokens) / rate
+    await client.set(keys[0], f"{tokens!r} {now!r}".encode(), px=math.ceil(burst / rate * 1000))
+    return repr(retry_after).encode()
+
+
+class RedisBackend(RateLimitBackend):
+    """
+    Token buckets shared by all workers through a redis.asyncio-compatible client.
+
+    Each take is one script call, so concurrent attempts from different workers cannot
+    both spend the last token.
+    """
+
+    def __init__(self, client, name: str = "redis"):
+        self.client = client
+        self.name = name
+        self._take = client.register_script(TAKE_SCRIPT)
+
+    async def take(self, key: str, limit: Limit) -> float:
+        retry_after = await self._take(keys=[f"ratelimit:{key}"], args=[limit.burst, limit.rate])
+        return float(retry_after)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class RateLimiter:
+    """Per-IP and per-email limits over one backend, with counters for /health and /metrics."""
+
+    def __init__(self, backend: Optional[RateLimitBackend], ip_limit: Limit, email_limit: Limit):
+        self.backend = backend
+        self.limits = (ip_limit, email_limit)
+        self.allowed = 0
+        self.rejected: Dict[str, int] = {ip_limit.name: 0, email_limit.name: 0}
+        self.errors = 0
+
+    async def check(self, ip: Optional[str], email: Optional[str]) -> float:
+        """Charge one attempt to ``ip`` and ``email``. Return 0 if allowed, else the Retry-After seconds."""
+        if self.backend is None:
+            return 0.0
+        for limit, value in zip(self.limits, (ip, email)):
+            if not value:
+                continue
+            try:
+                retry_after = await self.backend.take(f"{limit.name}:{value.strip().lower()}", limit)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Rate limit backend failed: {e}")
+                return 0.0
+            if retry_after > 0:
+                # The email bucket is left untouched when the IP is already over its limit
+                self.rejected[limit.name] += 1
+                return retry_after
+        self.allowed += 1
+        return 0.0
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.close()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name if self.backend is not None else "none",
+            "allowed": self.allowed,
+            "rejected": dict(self.rejected),
+            "errors": self.errors,
+            **(self.backend.stats() if self.backend is not None else {}),
+        }
+
+
+def create_rate_limiter(backend: str, ip_limit: Limit, email_limit: Limit, max_keys: int, redis_url: Optional[str] = None) -> RateLimiter:
+    if backend == "none":
+        return RateLimiter(None, ip_limit, email_limit)
+    ip_limit.validate()
+    email_limit.validate()
+    if backend == "memory":
+        return RateLimiter(MemoryBackend(max_keys), ip_limit, email_limit)
+    if backend == "redis":
+        import redis.asyncio as redis
+
+        return RateLimiter(RedisBackend(redis.Redis.from_url(redis_url)), ip_limit, email_limit)
+    if backend == "fake-redis":
+        return RateLimiter(RedisBackend(FakeRedis(), name="fake-redis"), ip_limit, email_limit)
+    raise ValueError(f"Unknown rate limit backend: {backend!r}")
@@ -0,0 +1,293 @@
+import asyncio
+import itertools
+import logging
+import time
+from abc import ABC, abstractmethod
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, List, Optional
+from urllib.parse import urlsplit
+
+from cache import TTLCache
+from db import ConnectError, Database, PoolTimeout, Session
+from response_cache import FakeRedis
+
+logger = logging.getLogger(__name__)
+
+# Seconds of replay lag. A replica that has replayed all the WAL it received counts as 0,
+# so a quiet primary (old last-commit timestamp) is not mistaken for lag.
+LAG_QUERY = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END::float8 AS lag"
+)
+
+STRATEGIES = ("round_robin", "least_busy")
+
+
+class Replica:
+    def __init__(self, name: str, dsn: str, database: Database):
+        self.name = name
+        # Host only: the DSN may carry a password
+        self.host = urlsplit(dsn).hostname or "localhost"
+        self.database = database
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.in_flight = 0
+        self.reads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def mark_unhealthy(self, error: str):
+        if self.healthy or self.failures == 0:
+            logger.warning(f"Read replica {self.name} ({self.host}) taken out of rotation: {error}")
+        self.healthy = False
+        self.failures += 1
+        self.last_error = error
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "host": self.host,
+            "healthy": self.healthy,
+            "lag_s": round(self.lag, 3) if self.lag is not None else None,
+            "in_flight": self.in_flight,
+            "reads": self.reads,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "pool": self.database.stats(),
+        }
+
+
+class RecentWriters(ABC):
+    """Users who wrote within the last ``seconds``, whose reads must stay on the primary."""
+
+    name = "backend"
+
+    @abstractmethod
+    async def add(self, key: str):
+        ...
+
+    @abstractmethod
+    async def contains(self, key: str) -> bool:
+        ...
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class MemoryWriters(RecentWriters):
+    """Per-process record. A user's next read can land on another worker that never saw the write."""
+
+    name = "memory"
+
+    def __init__(self, seconds: float, max_size: int):
+        self._writers = TTLCache(max_size, seconds, name="recent_writers")
+
+    async def add(self, key: str):
+        self._writers.set(key, True)
+
+    async def contains(self, key: str) -> bool:
+        return self._writers.get(key) is not None
+
+    def stats(self) -> dict:
+        return {"recent_writers": len(self._writers)}
+
+
+class RedisWriters(RecentWriters):
+    """Record shared by all workers: one key per writer through a redis.asyncio-compatible client, expiring after ``seconds``."""
+
+    def __init__(self, client, seconds: float, name: str = "redis"):
+        self.client = client
+        self.seconds = seconds
+        self.name = name
+
+    async def add(self, key: str):
+        await self.client.set(f"writer:{key}", b"1", px=max(1, int(self.seconds * 1000)))
+
+    async def contains(self, key: str) -> bool:
+        return await self.client.get(f"writer:{key}") is not None
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_recent_writers(backend: str, seconds: float, max_size: int = 100000, redis_url: Optional[str] = None) -> Optional[RecentWriters]:
+    if backend == "none" or seconds <= 0:
+        return None
+    if backend == "memory":
+        return MemoryWriters(seconds, max_size)
+    if backend == "redis":
+        import redis.asyncio as redis
+
+        return RedisWriters(redis.Redis.from_url(redis_url), seconds)
+    if backend == "fake-redis":
+        return RedisWriters(FakeRedis(), seconds, name="fake-redis")
+    raise ValueError(f"Unknown read-your-writes backend: {backend!r}")
+
+
+class ReplicaRouter:
+    """
+    Sends the sessions of read-only handlers to replica pools.
+
+    A replica is chosen among the healthy ones in turn (``round_robin``) or by the fewest
+    sessions in flight (``least_busy``). A background task checks every replica each
+    ``check_interval`` seconds. A replica that cannot be reached, or whose replay is more
+    than ``max_lag`` seconds behind, takes no reads until a later check passes. A replica
+    whose checkout fails during a request is taken out at once and that read falls back
+    to the primary.
+
+    For ``sticky_seconds`` after a user writes (see ``wrote``), that user's reads go to the
+    primary, so the user sees their own write while the replicas catch up. Writes are
+    recorded in ``writers``, which must be shared (redis) for this to hold across worker
+    processes. Reads under a token issued less than ``sticky_seconds`` ago also go to the
+    primary, since the user may have just signed up. When the record cannot be read, the
+    read goes to the primary too.
+    """
+
+    def __init__(self, primary: Database, replicas: List[Replica], strategy: str = "round_robin",
+                 max_lag: float = 5.0, check_interval: float = 5.0, sticky_seconds: float = 5.0,
+                 writers: Optional[RecentWriters] = None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown read strategy: {strategy!r} (expected one of {', '.join(STRATEGIES)})")
+        self.primary = primary
+        self.replicas = replicas
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.sticky_seconds = sticky_seconds
+        self.writers = writers
+        self.writer_errors = 0
+        self._turn = itertools.count()
+        self._task = None
+
+        # Reads served by the primary, by why no replica was used
+        self.primary_reads = {"sticky": 0, "no_healthy_replica": 0, "fallback": 0}
+
+    async def open(self):
+        """Open every replica pool and run a first check. An unreachable replica is left out of rotation; it does not fail startup."""
+        await asyncio.gather(*(self._open(replica) for replica in self.replicas))
+        await self.check()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            await replica.database.close()
+        if self.writers is not None:
+            await self.writers.close()
+
+    async def wrote(self, user_key: str):
+        """Record a write by ``user_key``; their reads stay on the primary for ``sticky_seconds``."""
+        if self.writers is None:
+            return
+        try:
+            await self.writers.add(user_key)
+        except Exception as e:
+            self.writer_errors += 1
+            logger.warning(f"Recording a write for read-your-writes failed: {e}")
+
+    async def _sticky(self, user_key: Optional[str], issued_at: Optional[float]) -> bool:
+        if self.sticky_seconds <= 0:
+            return False
+        # iat is in whole seconds, so a token can look up to a second older than it is
+        if issued_at is not None and time.time() - issued_at < self.sticky_seconds + 1:
+            return True
+        if user_key is None or self.writers is None:
+            return False
+        try:
+            return await self.writers.contains(user_key)
+        except Exception as e:
+            # The primary is never stale, so an unknown answer sends the read there
+            self.writer_errors += 1
+            logger.warning(f"Read-your-writes lookup failed: {e}")
+            return True
+
+    async def choose(self, user_key: Optional[str] = None, issued_at: Optional[float] = None) -> Optional[Replica]:
+        """The replica for the next read, or None when it must go to the primary."""
+        if await self._sticky(user_key, issued_at):
+            self.primary_reads["sticky"] += 1
+            return None
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            self.primary_reads["no_healthy_replica"] += 1
+            return None
+        if self.strategy == "least_busy":
+            # Fewer total reads breaks ties, which spreads the reads of a lightly loaded app
+            return min(healthy, key=lambda replica: (replica.in_flight, replica.reads))
+        return healthy[next(self._turn) % len(healthy)]
+
+    @asynccontextmanager
+    async def session(self, user_key: Optional[str] = None, issued_at: Optional[float] = None) -> AsyncIterator[Session]:
+        """A read-only session on the chosen replica, or on the primary."""
+        replica = await self.choose(user_key, issued_at)
+        async with AsyncExitStack() as stack:
+            db = None
+            if replica is not None:
+                try:
+                    db = await stack.enter_async_context(replica.database.session())
+                except (PoolTimeout, ConnectError) as e:
+                    replica.mark_unhealthy(str(e))
+                    self.primary_reads["fallback"] += 1
+                else:
+                    replica.reads += 1
+                    replica.in_flight += 1
+                    stack.callback(self._finished, replica)
+            if db is None:
+                db = await stack.enter_async_context(self.primary.session())
+            yield db
+
+    @staticmethod
+    def _finished(replica: Replica):
+        replica.in_flight -= 1
+
+    async def _open(self, replica: Replica):
+        # Startup waits at most one check interval per replica. A pool whose open is cut
+        # short keeps connecting in the background, and a later check puts it in rotation.
+        try:
+            await asyncio.wait_for(replica.database.open(), timeout=self.check_interval)
+        except Exception as e:
+            replica.mark_unhealthy(f"open failed: {str(e) or type(e).__name__}")
+
+    async def check(self):
+        await asyncio.gather(*(self._check(replica) for replica in self.replicas))
+
+    async def _check(self, replica: Replica):
+        try:
+            async with replica.database.session() as db:
+                row = await asyncio.wait_for(db.fetchone(LAG_QUERY), timeout=self.check_interval)
+        except Exception as e:
+            replica.mark_unhealthy(f"health check failed: {e}")
+            return
+        replica.lag = row["lag"]
+        if replica.lag > self.max_lag:
+            replica.mark_unhealthy(f"replay lag {replica.lag:.1f}s exceeds {self.max_lag}s")
+        elif not replica.healthy:
+            replica.healthy = True
+            logger.info(f"Read replica {replica.name} ({replica.host}) in rotation (lag {replica.lag:.3f}s)")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check()
+
+    def stats(self) -> dict:
+        return {
+            "strategy": self.strategy,
+            "max_lag_s": self.max_lag,
+            "sticky_seconds": self.sticky_seconds,
+            "writers": {
+                "backend": self.writers.name if self.writers is not None else "none",
+                "errors": self.writer_errors,
+                **(self.writers.stats() if self.writers is not None else {}),
+            },
+            "primary_reads": dict(self.primary_reads),
+            "replicas": [replica.stats() for replica in self.replicas],
+        }
@@ -0,0 +1,244 @@
+"""
+Response cache for the list endpoints.
+
+Entries hold the pre-serialized JSON body plus the few headers needed to replay it,
+keyed by user, endpoint, collection version and normalized query parameters. Every
+write bumps the collection version (see migrations 4-5), so invalidation is exact
+and needs no coordination between workers: a write simply makes the old keys
+unreachable, and they age out of the backend.
+
+Backends:
+    memory      in-process LRU bounded by total bytes (per worker)
+    redis       any client with the redis.asyncio get/set/delete API (shared by workers)
+    fake-redis  in-process stand-in for the redis backend, for local runs and tests
+    none        caching disabled
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(ABC):
+    name = "backend"
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float):
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class LRUBackend(CacheBackend):
+    """In-process LRU that evicts least recently used entries once ``max_bytes`` is exceeded."""
+
+    name = "memory"
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._data: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        # A single entry larger than the whole budget would only flush everything else
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (time.monotonic() + ttl, value)
+            self.bytes += len(value)
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+
+    async def delete(self, key: str):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[1])
+
+    def stats(self) -> dict:
+        return {"entries": len(self._data), "bytes": self.bytes, "max_bytes": self.max_bytes}
+
+
+class RedisBackend(CacheBackend):
+    """
+    Shared backend over a redis.asyncio-compatible client.
+
+    Memory is bounded by the server, which should run with an eviction policy such as
+    ``maxmemory-policy allkeys-lru``.
+    """
+
+    def __init__(self, client, name: str = "redis"):
+        self.client = client
+        self.name = name
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    async def delete(self, key: str):
+        await self.client.delete(key)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class FakeRedis:
+    """Minimal in-memory stand-in for the subset of the redis.asyncio client used here; entries only expire by TTL."""
+
+    # Lua scripts cannot run here, so each script used with register_script needs a Python twin
+    _scripts: Dict[str, Callable[["FakeRedis", Sequence[str], Sequence], Awaitable]] = {}
+
+    @classmethod
+    def emulate(cls, script: str):
+        """Register the decorated ``fn(client, keys, args)`` as the stand-in for ``script``."""
+
+        def register(fn):
+            cls._scripts[script] = fn
+            return fn
+
+        return register
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Optional[float], bytes]] = {}
+
+    def _live(self, key: str) -> Optional[Tuple[Optional[float], bytes]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._live(key)
+        return None if entry is None else entry[1]
+
+    async def set(self, key: str, value: bytes, px: Optional[int] = None):
+        expires_at = time.monotonic() + px / 1000 if px is not None else None
+        self._data[key] = (expires_at, value)
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def register_script(self, script: str):
+        fn = self._scripts[script]
+
+        async def run(keys: Sequence[str] = (), args: Sequence = ()):
+            return await fn(self, keys, args)
+
+        return run
+
+    async def aclose(self):
+        self._data.clear()
+
+
+class ResponseCache:
+    """Front end shared by all backends: key normalization, entry encoding and hit counters."""
+
+    def __init__(self, backend: Optional[CacheBackend], ttl: float, name: str = "responses"):
+        self.backend = backend
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @staticmethod
+    def key(user_id: int, endpoint: str, version: str, params: dict) -> str:
+        """Build a key that is identical for equivalent requests, whatever the parameter order."""
+        normalized = json.dumps(sorted((k, v) for k, v in params.items() if v is not None), default=str)
+        digest = hashlib.sha1(normalized.encode()).hexdigest()
+        return f"resp:{user_id}:{endpoint}:{version}:{digest}"
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, dict]]:
+        """Return ``(body, headers)`` for a cached response, or None."""
+        if self.backend is None:
+            return None
+        try:
+            entry = await self.backend.get(key)
+        except Exception as e:
+            # A cache outage degrades to uncached responses instead of failing requests
+            self.errors += 1
+            logger.warning(f"Response cache get failed: {e}")
+            return None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        header_line, body = entry.split(b"\n", 1)
+        return body, json.loads(header_line)
+
+    async def set(self, key: str, body: bytes, headers: dict):
+        if self.backend is None:
+            return
+        try:
+            await self.backend.set(key, json.dumps(headers).encode() + b"\n" + body, self.ttl)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache set failed: {e}")
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.close()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name if self.backend is not None else "none",
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            **(self.backend.stats() if self.backend is not None else {}),
+        }
+
+
+def create_response_cache(backend: str, ttl: float, max_bytes: int, redis_url: Optional[str] = None) -> ResponseCache:
+    if backend == "memory":
+        return ResponseCache(LRUBackend(max_bytes), ttl)
+    if backend == "redis":
+        import redis.asyncio as redis
+
+        return ResponseCache(RedisBackend(redis.Redis.from_url(redis_url)), ttl)
+    if backend == "fake-redis":
+        return ResponseCache(RedisBackend(FakeRedis(), name="fake-redis"), ttl)
+    if backend == "none":
+        return ResponseCache(None, ttl)
+    raise ValueError(f"Unknown response cache backend: {backend!r}")
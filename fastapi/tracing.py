@@ -0,0 +1,228 @@
+"""
+Per-request span timings, slow-request logging and sampled EXPLAIN capture.
+
+TracingMiddleware opens a Trace for every HTTP request in a context variable. Code on
+the request path wraps its phases in ``span(name)``: authentication, connection
+checkout, each statement (see db.Session) and response serialization. Outside a
+request ``span`` is a no-op. A request slower than ``tracer.slow_request_seconds`` is
+logged once on the "tracing" logger, with its spans as structured fields (see logs.py).
+Both logs are off until ``tracer.configure`` sets their thresholds, which the app does at
+startup, so importing the app never starts logging on its own.
+
+Statements slower than ``tracer.slow_query_seconds`` are logged the same way with their
+SQL (never their parameters). A sampled share of the slow read-only statements is
+re-run under ``EXPLAIN (ANALYZE, BUFFERS)`` on the same connection, inside a savepoint,
+and the plan is attached to the log line. Writes are never explained: ANALYZE would
+execute them a second time.
+"""
+import contextvars
+import logging
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Longest SQL text copied into a log line
+MAX_SQL_LENGTH = 2000
+# Bounds the memory of a trace whose request runs very many statements
+MAX_SPANS = 200
+
+_READ_ONLY = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+_WRITES = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|FOR\s+UPDATE|FOR\s+SHARE)\b", re.IGNORECASE)
+
+
+class Trace:
+    __slots__ = ("scope", "start", "spans", "dropped")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.start = time.perf_counter()
+        self.spans: List[tuple] = []
+        self.dropped = 0
+
+    @property
+    def route(self) -> str:
+        # Set on the scope by the router once the request has been matched
+        route = self.scope.get("route")
+        return route.path if route is not None else "unmatched"
+
+    def add(self, name: str, start: float, duration: float, attrs: Optional[dict] = None):
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append((name, start, duration, attrs))
+
+    def summary(self) -> Dict[str, Any]:
+        spans = []
+        totals: Dict[str, float] = {}
+        for name, start, duration, attrs in self.spans:
+            spans.append({
+                "name": name,
+                "start_ms": round((start - self.start) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3),
+                **(attrs or {}),
+            })
+            totals[name] = totals.get(name, 0.0) + duration
+        return {
+            "spans": spans,
+            "totals_ms": {name: round(total * 1000, 3) for name, total in totals.items()},
+            "dropped_spans": self.dropped,
+        }
+
+
+_current: "contextvars.ContextVar[Optional[Trace]]" = contextvars.ContextVar("trace", default=None)
+
+
+class _Span:
+    __slots__ = ("trace", "name", "attrs", "start")
+
+    def __init__(self, trace: Trace, name: str, attrs: dict):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, self.start, time.perf_counter() - self.start, self.attrs)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str, **attrs):
+    """Time the enclosed block as a span of the current request, if there is one."""
+    trace = _current.get()
+    if trace is None:
+        return _NO_SPAN
+    return _Span(trace, name, attrs)
+
+
+def add_span(name: str, start: float, duration: float, **attrs):
+    """Record an already measured span (``start`` from ``time.perf_counter()``)."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, start, duration, attrs)
+
+
+def _ms_or_none(seconds: float) -> Optional[float]:
+    return None if seconds == float("inf") else seconds * 1000
+
+
+def _log(record: dict):
+    logger.warning(record["event"], extra={"event": record["event"], "fields": record})
+
+
+class Tracer:
+    """Thresholds and sampling for the slow-request and slow-query logs."""
+
+    def __init__(self, slow_request_seconds: Optional[float] = None, slow_query_seconds: Optional[float] = None, explain_sample_rate: float = 0.0):
+        self.configure(slow_request_seconds, slow_query_seconds, explain_sample_rate)
+
+        self.slow_requests = 0
+        self.slow_queries = 0
+        self.explains = 0
+
+    def configure(self, slow_request_seconds: Optional[float], slow_query_seconds: Optional[float], explain_sample_rate: float = 0.0):
+        """Set the thresholds; None turns that log off."""
+        self.slow_request_seconds = float("inf") if slow_request_seconds is None else slow_request_seconds
+        self.slow_query_seconds = float("inf") if slow_query_seconds is None else slow_query_seconds
+        self.explain_sample_rate = explain_sample_rate
+
+    def request_finished(self, trace: Trace, status_code: int):
+        duration = time.perf_counter() - trace.start
+        if duration < self.slow_request_seconds:
+            return
+        self.slow_requests += 1
+        _log({
+            "event": "slow_request",
+            "method": trace.scope["method"],
+            "route": trace.route,
+            "path": trace.scope["path"],
+            "status": status_code,
+            "duration_ms": round(duration * 1000, 3),
+            **trace.summary(),
+        })
+
+    def should_explain(self, sql: str) -> bool:
+        return (
+            self.explain_sample_rate > 0
+            and bool(_READ_ONLY.match(sql))
+            and not _WRITES.search(sql)
+            and random.random() < self.explain_sample_rate
+        )
+
+    async def slow_query(self, session, label: str, sql: str, params, duration: float):
+        """Log a slow statement, with a sampled EXPLAIN (ANALYZE, BUFFERS) of it."""
+        self.slow_queries += 1
+        trace = _current.get()
+        record = {
+            "event": "slow_query",
+            "statement": label,
+            "duration_ms": round(duration * 1000, 3),
+            "route": trace.route if trace is not None else None,
+            "sql": sql[:MAX_SQL_LENGTH],
+        }
+        if self.should_explain(sql):
+            self.explains += 1
+            try:
+                record["plan"] = await session.explain(sql, params)
+            except Exception as e:
+                record["explain_error"] = str(e)
+        _log(record)
+
+    def stats(self) -> dict:
+        return {
+            "slow_request_ms": _ms_or_none(self.slow_request_seconds),
+            "slow_query_ms": _ms_or_none(self.slow_query_seconds),
+            "explain_sample_rate": self.explain_sample_rate,
+            "slow_requests": self.slow_requests,
+            "slow_queries": self.slow_queries,
+            "explains": self.explains,
+        }
+
+
+tracer = Tracer()
+
+
+class TracingMiddleware:
+    """ASGI middleware that gives each HTTP request a Trace and reports it if it was slow."""
+
+    def __init__(self, app, tracer: Tracer = tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(scope)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        token = _current.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            self.tracer.request_finished(trace, status_code)
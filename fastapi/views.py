@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import threading
+from typing import Dict
+
+from db import Database
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    """
+    Write-behind buffer for post view counts.
+
+    Reads only bump an in-memory counter; a background task adds the accumulated
+    deltas to ``posts.view_count`` with one UPDATE every ``flush_interval`` seconds.
+    Popular posts therefore no longer serialize on a row lock per view, at the cost
+    of losing at most ``flush_interval`` seconds of views if the process dies.
+    """
+
+    def __init__(self, flush_interval: float = 5.0):
+        self.flush_interval = flush_interval
+        self._pending: Dict[int, int] = {}
+        # Deltas taken by an in-progress flush, still reported until they are committed
+        self._flushing: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._task = None
+
+        self.flushes = 0
+        self.flushed_views = 0
+        self.failed_flushes = 0
+
+    def record(self, post_id: int) -> int:
+        """Count one view and return the views of ``post_id`` not yet written to the database."""
+        with self._lock:
+            self._pending[post_id] = self._pending.get(post_id, 0) + 1
+            return self._pending[post_id] + self._flushing.get(post_id, 0)
+
+    def pending(self, post_id: int) -> int:
+        """Views of ``post_id`` not yet written to the database, to add to a ``view_count`` just read."""
+        with self._lock:
+            return self._pending.get(post_id, 0) + self._flushing.get(post_id, 0)
+
+    async def flush(self, database: Database) -> int:
+        """Write every buffered delta in a single UPDATE and return how many views were written."""
+        with self._lock:
+            if not self._pending:
+                return 0
+            self._flushing, self._pending = self._pending, {}
+            batch = self._flushing
+        # Sorted ids give concurrent workers a consistent row-lock order
+        post_ids = sorted(batch)
+        try:
+            async with database.session() as db:
+                await db.execute(
+                    "UPDATE posts SET view_count = view_count + v.delta"
+                    " FROM unnest(%s::int[], %s::int[]) AS v(id, delta) WHERE posts.id = v.id",
+                    (post_ids, [batch[post_id] for post_id in post_ids])
+                )
+                await db.commit()
+        except BaseException:
+            # Put the deltas back so the next flush retries them
+            with self._lock:
+                for post_id, delta in batch.items():
+                    self._pending[post_id] = self._pending.get(post_id, 0) + delta
+                self._flushing = {}
+                self.failed_flushes += 1
+            raise
+        with self._lock:
+            self._flushing = {}
+            self.flushes += 1
+            self.flushed_views += sum(batch.values())
+        logger.debug(f"Flushed {sum(batch.values())} views across {len(batch)} posts")
+        return sum(batch.values())
+
+    async def _run(self, database: Database):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush(database)
+            except Exception as e:
+                logger.error(f"View count flush failed: {e}")
+
+    def start(self, database: Database):
+        self._task = asyncio.create_task(self._run(database))
+
+    async def stop(self, database: Database):
+        """Stop the periodic flush and write whatever is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush(database)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "flush_interval": self.flush_interval,
+                "pending_posts": len(self._pending),
+                "pending_views": sum(self._pending.values()),
+                "flushes": self.flushes,
+                "flushed_views": self.flushed_views,
+                "failed_flushes": self.failed_flushes,
+            }